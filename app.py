@@ -1,6 +1,12 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
+from collections import namedtuple
+import heapq
+import itertools
+from operator import attrgetter
+import functools
 import json
 from reportlab.lib.pagesizes import letter
 from reportlab.pdfgen import canvas
@@ -9,6 +15,16 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
 from reportlab.lib.units import inch
 import io
+import textwrap
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+# numba is optional: with it the planner core is compiled, without it the same code runs as plain Python
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        return lambda func: func
 
 # ======================
 # PAGE CONFIG
@@ -23,7 +39,7 @@ st.set_page_config(
 # ======================
 # CUSTOM CSS
 # ======================
-st.markdown("""
+_CSS = """
 <style>
     .main-header {
         font-size: 3rem;
@@ -36,13 +52,6 @@ st.markdown("""
         color: #4B5563;
         margin-top: 0;
     }
-    .subject-card {
-        background-color: #F3F4F6;
-        padding: 1.5rem;
-        border-radius: 10px;
-        border-left: 5px solid #3B82F6;
-        margin-bottom: 1rem;
-    }
     .plan-table {
         background-color: white;
         border-radius: 10px;
@@ -78,7 +87,14 @@ st.markdown("""
         font-size: 0.9rem;
     }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+@st.cache_resource
+def _inject_css():
+    """Inject the custom CSS; Streamlit replays the cached element on later reruns"""
+    st.markdown(_CSS, unsafe_allow_html=True)
+
+_inject_css()
 
 # ======================
 # ISLAMIC PRAYER TIMES (Alor Setar, Malaysia - 24 Dec 2025)
@@ -100,11 +116,53 @@ BREAK_TIMES = {
     "Snack Break (Afternoon)": "03:30 PM - 03:45 PM"
 }
 
+# Preferred study time windows offered in the sidebar
+TIME_SLOT_OPTIONS = [
+    "06:00 AM - 08:00 AM",
+    "08:00 AM - 10:00 AM", 
+    "10:00 AM - 12:00 PM",
+    "12:00 PM - 02:00 PM",
+    "02:00 PM - 04:00 PM",
+    "04:00 PM - 06:00 PM",
+    "06:00 PM - 08:00 PM",
+    "08:00 PM - 10:00 PM"
+]
+
+# Shortest study session worth scheduling (one 30-minute slot)
+MIN_SESSION_HOURS = 0.5
+
+# Subject fields shown in the Your Subjects table
+SUBJECT_COLUMNS = ["name", "deadline", "difficulty", "hours_needed"]
+
+# Finished or in-flight PDF builds kept per session
+PDF_CACHE_SIZE = 8
+
+# Prebuilt markup for the static prayer/break listings
+_PRAYER_TIMES_MARKDOWN = "\n".join(f"- **{prayer}:** {time} (10 minutes)" for prayer, time in ISLAMIC_PRAYER_TIMES.items())
+_BREAK_TIMES_MARKDOWN = "\n".join(f"- **{break_name}:** {time_range}" for break_name, time_range in BREAK_TIMES.items())
+_PRAYER_TIMES_HTML = "".join(f'<div class="prayer-time">{prayer}: {time}</div>' for prayer, time in ISLAMIC_PRAYER_TIMES.items())
+_BREAK_TIMES_HTML = "".join(f'<div class="prayer-time">{break_name}: {time_range}</div>' for break_name, time_range in BREAK_TIMES.items())
+
+# A single study session within a day: subject name, allocated hours and whether it was moved from a missed day
+Task = namedtuple('Task', 'subject hours extra', defaults=(False,))
+# A scheduled 30-minute slot: start/end in minutes after midnight and the subject studied
+TimeSlot = namedtuple('TimeSlot', 'start end task')
+# One day of the plan: its "Day N: Weekday" label, Task tuple and TimeSlot tuple
+DayPlan = namedtuple('DayPlan', 'day tasks slots', defaults=((),))
+
 # ======================
 # HELPER FUNCTIONS
 # ======================
-def create_pdf(study_plan, subjects, study_hours, selected_days):
-    """Create a PDF document from the study plan"""
+def format_task(task):
+    """Format a study task for display, e.g. Data Structures (1.5h), or (+1.5h) for redistributed work"""
+    return f"{task.subject} ({'+' if task.extra else ''}{task.hours:.1f}h)"
+
+def _build_pdf_bytes(plan_payload, subjects_payload, study_hours, selected_days):
+    """Create a PDF document from the study plan and return its bytes
+    
+    Runs on a _pdf_executor() worker, so it must not call any Streamlit API.
+    """
+    subjects = [dict(subject) for subject in subjects_payload]
     buffer = io.BytesIO()
     
     # Create the PDF object
@@ -158,9 +216,8 @@ def create_pdf(study_plan, subjects, study_hours, selected_days):
     elements.append(Paragraph("Weekly Study Plan", heading_style))
     
     plan_data = [["Day", "Study Plan"]]
-    for day_plan in study_plan:
+    for day_index, (day_name, tasks) in enumerate(plan_payload):
         # Clean day name - remove duplicate "Day X: " prefix
-        day_name = day_plan["Day"]
         if day_name.startswith("Day "):
             # Check if it already has the pattern we want
             parts = day_name.split(": ", 1)
@@ -170,26 +227,10 @@ def create_pdf(study_plan, subjects, study_hours, selected_days):
             else:
                 day_display = day_name
         else:
-            day_display = f"Day {study_plan.index(day_plan) + 1}: {day_name}"
-        
-        # Format tasks
-        tasks_text = ", ".join(day_plan["Tasks"])
-        # Wrap text for better PDF display
-        wrapped_tasks = []
-        current_line = ""
-        for task in day_plan["Tasks"]:
-            if len(current_line) + len(task) + 2 > 60:  # Approximate line length
-                wrapped_tasks.append(current_line)
-                current_line = task
-            else:
-                if current_line:
-                    current_line += ", " + task
-                else:
-                    current_line = task
-        if current_line:
-            wrapped_tasks.append(current_line)
+            day_display = f"Day {day_index + 1}: {day_name}"
         
-        tasks_display = "<br/>".join(wrapped_tasks)
+        # Format tasks, wrapped for better PDF display
+        tasks_display = textwrap.fill(", ".join(map(format_task, tasks)), width=60).replace("\n", "<br/>")
         plan_data.append([day_display, Paragraph(tasks_display, styles["Normal"])])
     
     plan_table = Table(plan_data, colWidths=[2*inch, 4.5*inch])
@@ -241,131 +282,312 @@ def create_pdf(study_plan, subjects, study_hours, selected_days):
     # Build PDF
     doc.build(elements)
     
-    buffer.seek(0)
-    return buffer
+    return buffer.getvalue()
 
-def is_time_conflict(time_str, prayer_times, break_times):
-    """Check if a time slot conflicts with prayer or break times"""
-    slot_start_str = time_str.split(" - ")[0]
-    slot_end_str = time_str.split(" - ")[1]
-    
-    # Convert to datetime for comparison
-    def to_datetime(time_str):
-        return datetime.strptime(time_str.strip(), "%I:%M %p")
+@st.cache_resource
+def _pdf_executor():
+    """Worker pool shared by all sessions for building PDFs off the script thread"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf")
+
+def request_pdf(plan_hash, plan_payload, subjects_payload, study_hours, selected_days):
+    """Return the session's future for this export, submitting a build unless one is cached
+    
+    Keyed on plan_hash instead of hashing the (day, tasks) pairs in plan_payload. Failed builds are retried.
+    """
+    pdf_cache = st.session_state.pdf_cache
+    key = (plan_hash, subjects_payload, study_hours, selected_days)
+    future = pdf_cache.pop(key, None)
+    if future is None or (future.done() and future.exception() is not None):
+        future = _pdf_executor().submit(_build_pdf_bytes, plan_payload, subjects_payload, study_hours, selected_days)
+    
+    # Reinsert as most recent and drop the oldest beyond the limit
+    pdf_cache[key] = future
+    while len(pdf_cache) > PDF_CACHE_SIZE:
+        pdf_cache.pop(next(iter(pdf_cache)))
+    return future
+
+def plan_fingerprint(plan_payload):
+    """Short content hash of (day, tasks) pairs, used to key cached exports"""
+    return hashlib.blake2b(json.dumps(plan_payload, default=str).encode(), digest_size=16).hexdigest()
+
+def store_study_plan(plan):
+    """Make plan the current study plan, precomputing its display view and export payload"""
+    st.session_state.study_plan = plan
+    st.session_state.plan_view = build_plan_view(plan)
+    st.session_state.plan_payload = tuple((day_plan.day, day_plan.tasks) for day_plan in plan)
+    st.session_state.plan_hash = plan_fingerprint(st.session_state.plan_payload)
+    st.session_state.pdf_future = None
+
+def build_plan_view(plan):
+    """Precompute what each day's expander shows, so reruns only render it"""
+    plan_view = []
+    for day_plan in plan:
+        # A task's slots are consecutive, so group runs of them and keep the first start and last end time
+        slot_groups = []
+        for task_name, group in itertools.groupby(day_plan.slots, key=attrgetter('task')):
+            slots = list(group)
+            slot_groups.append((f"{_format_minutes(slots[0].start)} - {_format_minutes(slots[-1].end)}", task_name))
+        
+        plan_view.append({
+            "day": day_plan.day,
+            "tasks_markdown": "\n".join(f"- {format_task(task)}" for task in day_plan.tasks),
+            "slot_groups": slot_groups
+        })
+    return plan_view
+
+def _to_minutes(time_str):
+    """Convert a clock time like 01:19 PM to minutes after midnight"""
+    parsed = datetime.strptime(time_str.strip(), "%I:%M %p")
+    return parsed.hour * 60 + parsed.minute
+
+def _format_minutes(minutes):
+    """Format minutes after midnight as a clock time like 01:30 PM"""
+    hour, minute = divmod(minutes % (24 * 60), 60)
+    return f"{hour % 12 or 12:02d}:{minute:02d} {'AM' if hour < 12 else 'PM'}"
+
+def _parse_range(time_range):
+    """Convert a range like 08:00 AM - 10:00 AM to (start_minute, end_minute)"""
+    start_time_str, end_time_str = time_range.split(" - ")
+    return _to_minutes(start_time_str), _to_minutes(end_time_str)
+
+def _conflict_intervals(prayer_times, break_times):
+    """Build sorted (start_minute, end_minute) pairs for prayer and break times (dicts or item tuples)"""
+    intervals = []
     
-    slot_start = to_datetime(slot_start_str)
-    slot_end = to_datetime(slot_end_str)
+    # Prayer times (10 minutes for each prayer)
+    for prayer_time in dict(prayer_times).values():
+        prayer_start = _to_minutes(prayer_time)
+        intervals.append((prayer_start, prayer_start + 10))
     
-    # Check prayer times (10 minutes for each prayer)
-    for prayer, prayer_time in prayer_times.items():
-        prayer_start = to_datetime(prayer_time)
-        prayer_end = prayer_start + timedelta(minutes=10)
-        
-        if not (slot_end <= prayer_start or slot_start >= prayer_end):
-            return True
-    
-    # Check break times
-    for break_name, break_range in break_times.items():
-        break_start_str, break_end_str = break_range.split(" - ")
-        break_start = to_datetime(break_start_str)
-        break_end = to_datetime(break_end_str)
-        
-        if not (slot_end <= break_start or slot_start >= break_end):
-            return True
+    # Break times
+    for break_range in dict(break_times).values():
+        intervals.append(_parse_range(break_range))
     
-    return False
+    return tuple(sorted(intervals))
 
-def assign_study_times(tasks, preferred_times, study_hours_per_day, prayer_times=None, break_times=None):
-    """Assign specific time slots to study tasks based on preferences, avoiding prayer and break times"""
-    if not preferred_times:
-        return []
-    
-    if prayer_times is None:
-        prayer_times = ISLAMIC_PRAYER_TIMES
-    if break_times is None:
-        break_times = BREAK_TIMES
+# Default conflicts, parsed once at import instead of once per time slot
+_CONFLICTS = _conflict_intervals(ISLAMIC_PRAYER_TIMES, BREAK_TIMES)
+
+# Sidebar time windows as (start_minute, end_minute), parsed once at import
+_TIME_SLOT_TABLE = {time_range: _parse_range(time_range) for time_range in TIME_SLOT_OPTIONS}
+
+def is_time_conflict(slot_start, slot_end, conflicts=_CONFLICTS):
+    """Check if a time slot (in minutes after midnight) conflicts with prayer or break times"""
+    return any(not (slot_end <= start or slot_start >= end) for start, end in conflicts)
+
+@functools.lru_cache(maxsize=64)
+def _free_slot_runs(preferred_times, conflicts=_CONFLICTS):
+    """Free 30-minute slots in the preferred times as (start, end) minutes, and the runs of back-to-back ones
     
+    Each run is a tuple of indices into the slots, split wherever a conflict leaves a gap.
+    """
     time_slots = []
+    runs = []
+    previous_end = None
     
     # Create time slots based on preferred times
     for time_range in preferred_times:
-        start_time_str, end_time_str = time_range.split(" - ")
-        start_time = datetime.strptime(start_time_str.strip(), "%I:%M %p")
-        end_time = datetime.strptime(end_time_str.strip(), "%I:%M %p")
+        start_minutes, end_minutes = _TIME_SLOT_TABLE.get(time_range) or _parse_range(time_range)
         
         # Calculate duration in hours
-        duration = (end_time - start_time).seconds / 3600
+        duration = ((end_minutes - start_minutes) % (24 * 60)) / 60
         
         # Divide into slots (each slot = 30 minutes)
         num_slots = int(duration * 2)
         for i in range(num_slots):
-            slot_start = start_time + timedelta(minutes=30 * i)
-            slot_end = slot_start + timedelta(minutes=30)
-            slot_time_str = f"{slot_start.strftime('%I:%M %p')} - {slot_end.strftime('%I:%M %p')}"
+            slot_start = start_minutes + 30 * i
+            slot_end = slot_start + 30
             
             # Check if this slot conflicts with prayer or break times
-            if not is_time_conflict(slot_time_str, prayer_times, break_times):
-                time_slots.append({
-                    'time': slot_time_str,
-                    'available': True,
-                    'task': None,
-                    'duration': 0.5  # 30 minutes = 0.5 hours
-                })
+            if not is_time_conflict(slot_start, slot_end, conflicts):
+                if slot_start != previous_end:
+                    runs.append([])
+                runs[-1].append(len(time_slots))
+                previous_end = slot_end
+                time_slots.append((slot_start, slot_end))
+    
+    return tuple(time_slots), tuple(tuple(run) for run in runs)
+
+def longest_session_hours(preferred_times):
+    """Longest session one free run of the preferred times can hold, or None when there is no limit to apply"""
+    _, runs = _free_slot_runs(tuple(preferred_times))
+    if not runs:
+        return None
+    return max(len(run) for run in runs) * MIN_SESSION_HOURS
+
+@functools.lru_cache(maxsize=256)
+def assign_study_times(tasks, preferred_times, study_hours_per_day, prayer_times=None, break_times=None):
+    """Assign specific time slots to study tasks based on preferences, avoiding prayer and break times
+    
+    Memoized, so all arguments must be hashable and the result is shared: pass tuples, with custom
+    prayer_times/break_times given as tuple(d.items()).
+    """
+    if not preferred_times:
+        return ()
     
+    if prayer_times is None and break_times is None:
+        conflicts = _CONFLICTS
+    else:
+        conflicts = _conflict_intervals(
+            ISLAMIC_PRAYER_TIMES if prayer_times is None else prayer_times,
+            BREAK_TIMES if break_times is None else break_times
+        )
+    
+    time_slots, runs = _free_slot_runs(preferred_times, conflicts)
     if not time_slots:
-        return []
+        return ()
+    runs = list(runs)
     
     # Sort tasks by hours (descending)
-    sorted_tasks = []
-    for task_str in tasks:
-        task_name = task_str.split(" (")[0]
-        task_hours = float(task_str.split("(")[1].replace("h)", ""))
-        sorted_tasks.append((task_name, task_hours))
-    
+    sorted_tasks = [(task.subject, task.hours) for task in tasks]
     sorted_tasks.sort(key=lambda x: x[1], reverse=True)
     
     # Assign tasks to time slots
-    task_index = 0
-    slot_index = 0
-    
-    while task_index < len(sorted_tasks) and slot_index < len(time_slots):
-        task_name, task_hours = sorted_tasks[task_index]
-        
-        # Find consecutive available slots for this task
+    slot_tasks = [None] * len(time_slots)
+    for task_name, task_hours in sorted_tasks:
         slots_needed = int(task_hours * 2)  # Convert hours to 30-min slots
         
-        # Check if we have enough consecutive available slots
-        consecutive_slots = 0
-        available_start_index = -1
+        # Earliest run long enough for the whole session; a task that fits nowhere is skipped,
+        # leaving the shorter runs for the smaller tasks after it
+        run_index = next((j for j, run in enumerate(runs) if len(run) >= slots_needed), None)
+        if run_index is None:
+            continue
         
-        for i in range(slot_index, len(time_slots)):
-            if time_slots[i]['available']:
-                if available_start_index == -1:
-                    available_start_index = i
-                consecutive_slots += 1
-                if consecutive_slots >= slots_needed:
-                    break
-            else:
-                consecutive_slots = 0
-                available_start_index = -1
+        run = runs[run_index]
+        for i in run[:slots_needed]:
+            slot_tasks[i] = task_name
         
-        # If we have enough slots, assign the task
-        if consecutive_slots >= slots_needed:
-            for i in range(slots_needed):
-                time_slots[available_start_index + i]['task'] = task_name
-                time_slots[available_start_index + i]['available'] = False
-            
-            task_index += 1
-            slot_index = available_start_index + slots_needed
+        if len(run) > slots_needed:
+            runs[run_index] = run[slots_needed:]
         else:
-            # Move to next slot if current one isn't available
-            slot_index += 1
+            del runs[run_index]
     
     # Filter out only slots with assigned tasks
-    assigned_slots = [slot for slot in time_slots if slot['task'] is not None]
+    assigned_slots = tuple(
+        TimeSlot(start, end, task_name)
+        for (start, end), task_name in zip(time_slots, slot_tasks)
+        if task_name is not None
+    )
     
     return assigned_slots
 
+@njit(cache=True)
+def _plan_core(remaining, deadline_days, priority, n_days, hours_per_day, session_cap):
+    """Least-slack-time allocation; returns alloc[day, subject] hours and each day's subject order"""
+    n_subjects = remaining.shape[0]
+    alloc = np.zeros((n_days, n_subjects), dtype=np.float32)
+    orders = np.empty((n_days, n_subjects), dtype=np.int64)
+    remaining = remaining.copy()
+    deadline_days = deadline_days.copy()
+    
+    # Stable sorts: harder subjects first, then least slack, so priority only breaks slack ties
+    by_priority = np.argsort(-priority, kind='mergesort')
+    for day in range(n_days):
+        # Slack in hours: hours left before the deadline minus hours of work left. Same order as
+        # days of slack, but exact in float32 for half-hour inputs, so true ties stay ties
+        slack = deadline_days * hours_per_day - remaining
+        order = by_priority[np.argsort(slack[by_priority], kind='mergesort')]
+        orders[day] = order
+        
+        # Fill the day in that order, each session capped by difficulty: a subject gets
+        # whatever of the day is left after the sessions ahead of it
+        wanted = np.minimum(remaining[order], session_cap[order])
+        granted = np.minimum(wanted, np.maximum(hours_per_day - (np.cumsum(wanted) - wanted), 0))
+        alloc[day, order] = granted
+        remaining[order] = remaining[order] - granted
+        deadline_days -= 1
+    
+    return alloc, orders
+
+def _fill_spare_capacity(alloc, leftover, order, hours_per_day, max_session):
+    """Give leftover subject hours to the days with the most free time, keeping each subject's day within max_session"""
+    capacity = hours_per_day - alloc.sum(axis=1)
+    heap = [(-day_capacity, day) for day, day_capacity in enumerate(capacity) if day_capacity >= MIN_SESSION_HOURS]
+    heapq.heapify(heap)
+    
+    # Running total so the loop can stop as soon as everything is placed
+    total_left = float(leftover.sum())
+    while heap and total_left > 0:
+        neg_capacity, day = heapq.heappop(heap)
+        day_capacity = -neg_capacity
+        
+        # Most urgent subject that still has hours left and room for a longer session on this day
+        for i in order:
+            hours_to_add = min(day_capacity, leftover[i], MIN_SESSION_HOURS * 2, max_session - alloc[day, i])
+            if hours_to_add > 0:
+                alloc[day, i] += hours_to_add
+                leftover[i] -= hours_to_add
+                total_left -= hours_to_add
+                day_capacity -= hours_to_add
+                break
+        else:
+            continue  # Nothing left fits on this day
+        
+        if day_capacity >= MIN_SESSION_HOURS:
+            heapq.heappush(heap, (-day_capacity, day))
+    
+    return alloc
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def _generate_plan(subjects_tuple, days_tuple, hours_per_day, preferred_times_tuple, today):
+    """Build the weekly study plan from hashable inputs so Streamlit can memoize it across reruns
+    
+    today is part of the cache key because deadline distances depend on it, so a new date always replans.
+    """
+    subjects = [dict(subject) for subject in subjects_tuple]
+    
+    # Per-subject state lives in arrays indexed by subject position
+    plan = []
+    records = {"day": [], "subject": [], "hours": []}  # Column-oriented for a fast DataFrame build
+    names = [subject['name'] for subject in subjects]
+    remaining = np.array([subject['hours_needed'] for subject in subjects], dtype=np.float32)
+    priority = np.array([subject['priority'] for subject in subjects], dtype=np.float32)
+    # Hard gets longer sessions, but no session may outgrow the longest free run of the preferred times
+    max_session = longest_session_hours(preferred_times_tuple) or hours_per_day
+    session_cap = np.minimum(priority * 0.5, np.float32(max_session))
+    
+    # Days until each deadline, from the date objects stored when subjects are added
+    deadline_days = np.array([(subject['deadline_dt'] - today).days for subject in subjects], dtype=np.float32)
+    
+    alloc, orders = _plan_core(remaining, deadline_days, priority, len(days_tuple), np.float32(hours_per_day), session_cap)
+    
+    # If there are still remaining hours, redistribute them into free time,
+    # most constrained first: highest hours needed per day left until the deadline, then hardest
+    urgency_density = remaining / np.maximum(1, deadline_days)
+    by_urgency = np.lexsort((-priority, -urgency_density))
+    leftover = remaining - alloc.sum(axis=0)
+    alloc = _fill_spare_capacity(alloc, leftover, by_urgency, hours_per_day, max_session)
+    
+    # Distribute hours across days (starting from Day 1)
+    day_number = 1
+    for day, day_alloc, order in zip(days_tuple, alloc, orders):
+        day_label = f"Day {day_number}: {day}"
+        tasks = []
+        
+        for i in order:
+            hours_to_allocate = float(day_alloc[i])
+            if hours_to_allocate > 0:
+                tasks.append(Task(names[i], hours_to_allocate))
+                records["day"].append(day_label)
+                records["subject"].append(names[i])
+                records["hours"].append(hours_to_allocate)
+        
+        if tasks:
+            tasks = tuple(tasks)
+            # Assign time slots if preferred times are selected
+            time_slots = ()
+            if preferred_times_tuple:
+                time_slots = assign_study_times(
+                    tasks, 
+                    preferred_times_tuple, 
+                    hours_per_day
+                )
+            
+            plan.append(DayPlan(day_label, tasks, time_slots))
+            day_number += 1
+    
+    return tuple(plan), records
+
 # ======================
 # APP HEADER
 # ======================
@@ -380,21 +602,41 @@ st.divider()
 # ======================
 if 'subjects' not in st.session_state:
     st.session_state.subjects = []
+if 'subjects_removed' not in st.session_state:
+    st.session_state.subjects_removed = False
 if 'study_plan' not in st.session_state:
     st.session_state.study_plan = None
+if 'plan_view' not in st.session_state:
+    st.session_state.plan_view = []
+if 'plan_payload' not in st.session_state:
+    st.session_state.plan_payload = ()
+if 'plan_hash' not in st.session_state:
+    st.session_state.plan_hash = None
+if 'pdf_cache' not in st.session_state:
+    st.session_state.pdf_cache = {}
+if 'pdf_future' not in st.session_state:
+    st.session_state.pdf_future = None
 if 'original_plan' not in st.session_state:
     st.session_state.original_plan = None
+if 'plan_by_day' not in st.session_state:
+    st.session_state.plan_by_day = {}
+if 'tasks_df' not in st.session_state:
+    st.session_state.tasks_df = None
 if 'preferred_times' not in st.session_state:
     st.session_state.preferred_times = ["08:00 AM - 10:00 AM", "02:00 PM - 04:00 PM"]
 if 'study_hours' not in st.session_state:
     st.session_state.study_hours = 2.5
 if 'selected_days' not in st.session_state:
     st.session_state.selected_days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]
+if 'clean_selected_days' not in st.session_state:
+    st.session_state.clean_selected_days = list(st.session_state.selected_days)
 
 # ======================
 # SIDEBAR - AVAILABILITY SETTINGS
 # ======================
-with st.sidebar:
+@st.fragment
+def availability_settings():
+    """Sidebar settings; changing one reruns only this fragment and saves it to session state"""
     st.header("🎯 Your Availability")
     
     # Study Days
@@ -415,20 +657,9 @@ with st.sidebar:
     st.markdown("Select your preferred study time slots:")
     
     # Time slots selection
-    time_slots_options = [
-        "06:00 AM - 08:00 AM",
-        "08:00 AM - 10:00 AM", 
-        "10:00 AM - 12:00 PM",
-        "12:00 PM - 02:00 PM",
-        "02:00 PM - 04:00 PM",
-        "04:00 PM - 06:00 PM",
-        "06:00 PM - 08:00 PM",
-        "08:00 PM - 10:00 PM"
-    ]
-    
     preferred_times = st.multiselect(
         "Choose your preferred time slots:",
-        time_slots_options,
+        TIME_SLOT_OPTIONS,
         default=st.session_state.preferred_times,
         help="Select time windows when you prefer to study"
     )
@@ -439,21 +670,30 @@ with st.sidebar:
         st.info("These times are automatically excluded from your study schedule")
         
         st.markdown("**Islamic Prayer Times (Alor Setar):**")
-        for prayer, time in ISLAMIC_PRAYER_TIMES.items():
-            st.markdown(f"- **{prayer}:** {time} (10 minutes)")
+        st.markdown(_PRAYER_TIMES_MARKDOWN)
         
         st.markdown("**Break Times:**")
-        for break_name, time_range in BREAK_TIMES.items():
-            st.markdown(f"- **{break_name}:** {time_range}")
+        st.markdown(_BREAK_TIMES_MARKDOWN)
+    
+    # The Generate button and the select-a-day warning outside this fragment only
+    # change when the day list empties or refills, so only then rerun the whole app
+    days_emptied_or_refilled = bool(selected_days) != bool(st.session_state.selected_days)
     
     # Save to session state
     st.session_state.selected_days = selected_days
+    # Day names without any "Day X: " prefix, shared by plan generation and PDF export
+    st.session_state.clean_selected_days = [day.split(": ")[-1] if ": " in day else day for day in selected_days]
     st.session_state.study_hours = study_hours
     st.session_state.preferred_times = preferred_times
+    if days_emptied_or_refilled:
+        st.rerun()
     
     st.divider()
     st.caption("📌 Your settings are saved automatically")
 
+with st.sidebar:
+    availability_settings()
+
 # ======================
 # MAIN CONTENT AREA
 # ======================
@@ -482,6 +722,7 @@ with col1:
             new_subject = {
                 "name": subject_name,
                 "deadline": deadline.strftime("%Y-%m-%d"),
+                "deadline_dt": deadline,
                 "difficulty": difficulty,
                 "hours_needed": hours_needed,
                 "priority": {"Easy": 1, "Medium": 2, "Hard": 3}[difficulty]
@@ -493,94 +734,82 @@ with col1:
 # ======================
 # DISPLAY ADDED SUBJECTS
 # ======================
-with col2:
+def _remove_ticked_subjects():
+    """Drop every subject whose Remove box was ticked, before the table is redrawn"""
+    edited_rows = st.session_state.subjects_editor["edited_rows"]
+    to_remove = {row for row, edits in edited_rows.items() if edits.get("Remove")}
+    if to_remove:
+        st.session_state.subjects = [
+            subject for i, subject in enumerate(st.session_state.subjects) if i not in to_remove
+        ]
+        # Row edits are stored by position, so clear them before the list shifts
+        del st.session_state.subjects_editor
+        st.session_state.subjects_removed = True
+
+@st.fragment
+def subjects_panel():
+    """List added subjects in a table with a Remove checkbox per row"""
+    # The editor's callback reruns only this fragment, but the Generate button and
+    # missing-subject warnings outside it depend on the subject list too
+    if st.session_state.subjects_removed:
+        st.session_state.subjects_removed = False
+        st.rerun()
+    
     st.header("📚 Your Subjects")
     
     if not st.session_state.subjects:
         st.info("No subjects added yet. Add your first subject on the left!")
     else:
-        for i, subject in enumerate(st.session_state.subjects):
-            with st.container():
-                st.markdown(f"""
-                <div class="subject-card">
-                    <h4>{subject['name']}</h4>
-                    <p>📅 Deadline: {subject['deadline']}</p>
-                    <p>⚡ Difficulty: {subject['difficulty']}</p>
-                    <p>⏱️ Hours/week: {subject['hours_needed']}</p>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Remove button for each subject
-                if st.button(f"Remove {subject['name']}", key=f"remove_{i}"):
-                    st.session_state.subjects.pop(i)
-                    st.rerun()
+        # One editable table; only the Remove column can be changed
+        subjects_df = pd.DataFrame(st.session_state.subjects, columns=SUBJECT_COLUMNS)
+        subjects_df["Remove"] = False
+        st.data_editor(
+            subjects_df,
+            column_config={
+                "name": "Subject",
+                "deadline": "📅 Deadline",
+                "difficulty": "⚡ Difficulty",
+                "hours_needed": "⏱️ Hours/week",
+                "Remove": st.column_config.CheckboxColumn("Remove")
+            },
+            disabled=SUBJECT_COLUMNS,
+            hide_index=True,
+            use_container_width=True,
+            key="subjects_editor",
+            on_change=_remove_ticked_subjects
+        )
+
+with col2:
+    subjects_panel()
 
 st.divider()
 
 # ======================
 # GENERATE PLAN BUTTON
 # ======================
-if st.session_state.subjects and selected_days:
+if st.session_state.subjects and st.session_state.selected_days:
     if st.button("🚀 Generate Weekly Study Plan", use_container_width=True):
         with st.spinner("Creating your optimized study plan..."):
-            # Simple planning algorithm
-            plan = []
-            remaining_hours = {subject['name']: subject['hours_needed'] for subject in st.session_state.subjects}
-            
-            # Sort subjects by priority (deadline proximity + difficulty)
-            sorted_subjects = sorted(
-                st.session_state.subjects,
-                key=lambda x: (
-                    (datetime.strptime(x['deadline'], "%Y-%m-%d") - datetime.now()).days,
-                    -x['priority']
-                )
+            plan, records = _generate_plan(
+                tuple(tuple(subject.items()) for subject in st.session_state.subjects),
+                tuple(st.session_state.clean_selected_days),
+                st.session_state.study_hours,
+                tuple(st.session_state.preferred_times),
+                datetime.now().date()
             )
             
-            # Distribute hours across days (starting from Day 1)
-            day_number = 1
-            for day in selected_days:
-                # Clean day name
-                clean_day_name = day.split(": ")[-1] if ": " in day else day
-                day_plan = {"Day": f"Day {day_number}: {clean_day_name}", "Tasks": [], "TimeSlots": []}
-                day_hours_used = 0
-                
-                for subject in sorted_subjects:
-                    if remaining_hours[subject['name']] > 0:
-                        # Allocate hours based on priority
-                        hours_to_allocate = min(
-                            study_hours - day_hours_used,
-                            remaining_hours[subject['name']],
-                            subject['priority'] * 0.5  # Hard gets more hours
-                        )
-                        
-                        if hours_to_allocate > 0:
-                            day_plan["Tasks"].append(
-                                f"{subject['name']} ({hours_to_allocate:.1f}h)"
-                            )
-                            remaining_hours[subject['name']] -= hours_to_allocate
-                            day_hours_used += hours_to_allocate
-                
-                if day_plan["Tasks"]:
-                    # Assign time slots if preferred times are selected
-                    if st.session_state.preferred_times:
-                        time_slots = assign_study_times(
-                            day_plan["Tasks"], 
-                            st.session_state.preferred_times, 
-                            study_hours
-                        )
-                        day_plan["TimeSlots"] = time_slots
-                    
-                    plan.append(day_plan)
-                    day_number += 1
-            
-            st.session_state.study_plan = plan
-            st.session_state.original_plan = plan.copy()
+            store_study_plan(plan)
+            # The plan is immutable, so the baseline shares it; re-adjusting builds a new tuple
+            st.session_state.original_plan = plan
+            st.session_state.plan_by_day = {day_plan.day: day_plan for day_plan in plan}
+            st.session_state.tasks_df = pd.DataFrame(records)
             st.success("✅ Study plan generated!")
 
 # ======================
 # DISPLAY STUDY PLAN
 # ======================
-if st.session_state.study_plan:
+def study_plan_section():
+    """Day-by-day plan with its time schedule and prayer/break reference"""
     st.markdown('<div class="plan-table">', unsafe_allow_html=True)
     st.header("📅 Your Weekly Study Plan")
     
@@ -589,44 +818,24 @@ if st.session_state.study_plan:
         col_prayer1, col_prayer2 = st.columns(2)
         with col_prayer1:
             st.markdown("**Islamic Prayer Times:**")
-            for prayer, time in ISLAMIC_PRAYER_TIMES.items():
-                st.markdown(f'<div class="prayer-time">{prayer}: {time}</div>', unsafe_allow_html=True)
+            st.markdown(_PRAYER_TIMES_HTML, unsafe_allow_html=True)
         
         with col_prayer2:
             st.markdown("**Break Times:**")
-            for break_name, time_range in BREAK_TIMES.items():
-                st.markdown(f'<div class="prayer-time">{break_name}: {time_range}</div>', unsafe_allow_html=True)
+            st.markdown(_BREAK_TIMES_HTML, unsafe_allow_html=True)
     
     # Display with time slots if available
-    for day_plan in st.session_state.study_plan:
-        with st.expander(f"📌 {day_plan['Day']}", expanded=False):
+    for day_view in st.session_state.plan_view:
+        with st.expander(f"📌 {day_view['day']}", expanded=False):
             st.markdown("**Study Tasks:**")
-            for task in day_plan['Tasks']:
-                st.markdown(f"- {task}")
+            st.markdown(day_view['tasks_markdown'])
             
             # Display time slots if available
-            if day_plan.get('TimeSlots'):
+            if day_view['slot_groups']:
                 st.markdown("**📅 Time Schedule:**")
-                
-                # Group time slots by task
-                task_slots = {}
-                for slot in day_plan['TimeSlots']:
-                    if slot['task'] not in task_slots:
-                        task_slots[slot['task']] = []
-                    task_slots[slot['task']].append(slot['time'])
-                
-                # Display grouped time slots
-                for task_name, times in task_slots.items():
-                    # Combine consecutive times
-                    if times:
-                        time_ranges = []
-                        start_time = times[0].split(" - ")[0]
-                        end_time = times[-1].split(" - ")[1]
-                        time_ranges.append(f"{start_time} - {end_time}")
-                        
-                        for time_range in time_ranges:
-                            st.markdown(f"<div class='time-slot'>{time_range}: {task_name}</div>", 
-                                      unsafe_allow_html=True)
+                for time_range, task_name in day_view['slot_groups']:
+                    st.markdown(f"<div class='time-slot'>{time_range}: {task_name}</div>", 
+                              unsafe_allow_html=True)
             else:
                 if st.session_state.preferred_times:
                     st.info("⚠️ No available time slots that don't conflict with prayer/break times. Try selecting different preferred times.")
@@ -644,15 +853,18 @@ if st.session_state.study_plan:
         """)
     
     st.markdown('</div>', unsafe_allow_html=True)
-    
-    # ======================
-    # MISSED DAY ADJUSTMENT
-    # ======================
+
+# ======================
+# MISSED DAY ADJUSTMENT
+# ======================
+@st.fragment
+def missed_day_section():
+    """Missed-day picker; changing it reruns only this fragment, re-adjusting reruns the app"""
     st.subheader("⚠️ Missed a Study Day?")
     
     col3, col4 = st.columns([2, 1])
     with col3:
-        available_days = [day_plan["Day"] for day_plan in st.session_state.study_plan]
+        available_days = [day_plan.day for day_plan in st.session_state.study_plan]
         if available_days:
             missed_day = st.selectbox("Select missed day", available_days)
         else:
@@ -662,44 +874,49 @@ if st.session_state.study_plan:
         if missed_day and st.button("Re-adjust Plan", use_container_width=True):
             # Simple redistribution algorithm
             original_plan = st.session_state.original_plan
-            missed_plan = next(p for p in original_plan if p["Day"] == missed_day)
+            missed_plan = st.session_state.plan_by_day[missed_day]
             
             # Redistribute tasks to remaining days
-            adjusted_plan = [p for p in original_plan if p["Day"] != missed_day]
+            adjusted_plan = [p for p in original_plan if p.day != missed_day]
             
             # Add redistributed tasks (simplified logic)
-            for task in missed_plan["Tasks"]:
-                if adjusted_plan:
-                    adjusted_plan[0]["Tasks"].append(task)
+            if adjusted_plan:
+                first_day = adjusted_plan[0]
+                moved_tasks = tuple(task._replace(extra=True) for task in missed_plan.tasks)
+                adjusted_plan[0] = first_day._replace(tasks=first_day.tasks + moved_tasks)
             
-            st.session_state.study_plan = adjusted_plan
+            store_study_plan(tuple(adjusted_plan))
             st.success("Plan adjusted! Missed workload redistributed.")
             st.rerun()
-    
-    # ======================
-    # WEEKLY LOAD SUMMARY
-    # ======================
+
+# ======================
+# WEEKLY LOAD SUMMARY
+# ======================
+def weekly_load_section():
+    """Total planned hours per subject as one bar chart"""
     st.subheader("📊 Weekly Load Summary")
     
     # Calculate total hours per subject
-    subject_totals = {}
-    for day_plan in st.session_state.original_plan:
-        for task in day_plan["Tasks"]:
-            subject = task.split(" (")[0]
-            hours = float(task.split("(")[1].replace("h)", ""))
-            subject_totals[subject] = subject_totals.get(subject, 0) + hours
-    
-    # Display progress bars
-    if subject_totals:
-        for subject, hours in subject_totals.items():
-            max_hours = max(subject_totals.values())
-            percentage = (hours / max_hours) * 100 if max_hours > 0 else 0
-            st.markdown(f"**{subject}**")
-            st.progress(percentage / 100, text=f"{hours:.1f} hours")
-    
-    # ======================
-    # EXPORT OPTIONS
-    # ======================
+    tasks_df = st.session_state.tasks_df
+    
+    # Display one bar chart for all subjects
+    if tasks_df is not None and not tasks_df.empty:
+        totals = tasks_df.groupby('subject', sort=False)['hours'].sum()
+        st.bar_chart(totals.rename_axis("Subject").to_frame("Hours"), horizontal=True)
+
+# ======================
+# EXPORT OPTIONS
+# ======================
+@st.fragment(run_every=0.5)
+def pdf_progress():
+    """Poll the PDF worker; once it finishes, rerun so the download button replaces this"""
+    if st.session_state.pdf_future.done():
+        st.rerun()
+    st.info("Generating PDF...")
+
+@st.fragment
+def export_section():
+    """Clipboard and PDF export; button clicks rerun only this fragment"""
     st.divider()
     st.subheader("📤 Export Your Plan")
     
@@ -707,24 +924,24 @@ if st.session_state.study_plan:
     
     with col_export1:
         if st.button("📋 Copy Plan to Clipboard", use_container_width=True):
-            plan_text = "📚 STUDY.PLANNER - Your Weekly Plan\n\n"
-            plan_text += "🕌 Prayer Times (10 min each):\n"
+            parts = ["📚 STUDY.PLANNER - Your Weekly Plan\n\n", "🕌 Prayer Times (10 min each):\n"]
             for prayer, time in ISLAMIC_PRAYER_TIMES.items():
-                plan_text += f"  - {prayer}: {time}\n"
+                parts.append(f"  - {prayer}: {time}\n")
             
-            plan_text += "\n🍽️ Break Times:\n"
+            parts.append("\n🍽️ Break Times:\n")
             for break_name, time_range in BREAK_TIMES.items():
-                plan_text += f"  - {break_name}: {time_range}\n"
+                parts.append(f"  - {break_name}: {time_range}\n")
             
-            plan_text += "\n📅 Study Schedule:\n"
+            parts.append("\n📅 Study Schedule:\n")
             for day_plan in st.session_state.study_plan:
-                plan_text += f"\n**{day_plan['Day']}:**\n"
-                for task in day_plan['Tasks']:
-                    plan_text += f"  - {task}\n"
-                if day_plan.get('TimeSlots'):
-                    plan_text += "  Time Schedule:\n"
-                    for slot in day_plan['TimeSlots']:
-                        plan_text += f"    - {slot['time']}: {slot['task']}\n"
+                parts.append(f"\n**{day_plan.day}:**\n")
+                for task in day_plan.tasks:
+                    parts.append(f"  - {format_task(task)}\n")
+                if day_plan.slots:
+                    parts.append("  Time Schedule:\n")
+                    for slot in day_plan.slots:
+                        parts.append(f"    - {_format_minutes(slot.start)} - {_format_minutes(slot.end)}: {slot.task}\n")
+            plan_text = "".join(parts)
             
             # Copy to clipboard (simulated)
             st.code(plan_text, language="text")
@@ -733,33 +950,42 @@ if st.session_state.study_plan:
     with col_export2:
         # PDF Export
         if st.button("📄 Export to PDF", use_container_width=True):
-            with st.spinner("Generating PDF..."):
-                # Clean day names for PDF
-                clean_selected_days = []
-                for day in selected_days:
-                    clean_day = day.split(": ")[-1] if ": " in day else day
-                    clean_selected_days.append(clean_day)
-                
-                pdf_buffer = create_pdf(
-                    st.session_state.study_plan,
-                    st.session_state.subjects,
-                    st.session_state.study_hours,
-                    clean_selected_days
-                )
-                
+            st.session_state.pdf_future = request_pdf(
+                st.session_state.plan_hash,
+                st.session_state.plan_payload,
+                tuple(tuple(subject.items()) for subject in st.session_state.subjects),
+                st.session_state.study_hours,
+                tuple(st.session_state.clean_selected_days)
+            )
+        
+        pdf_future = st.session_state.pdf_future
+        if pdf_future is not None:
+            if not pdf_future.done():
+                pdf_progress()
+            elif pdf_future.exception() is not None:
+                st.error(f"Could not generate the PDF: {pdf_future.exception()}")
+            else:
                 # Provide download button
                 st.download_button(
                     label="⬇️ Download PDF",
-                    data=pdf_buffer,
+                    data=pdf_future.result(),
                     file_name=f"study_plan_{datetime.now().strftime('%Y%m%d_%H%M')}.pdf",
                     mime="application/pdf",
                     use_container_width=True
                 )
                 st.success("PDF generated! Click download to save.")
 
-elif st.session_state.subjects and not selected_days:
+# ======================
+# RENDER PLAN
+# ======================
+if st.session_state.study_plan:
+    study_plan_section()
+    missed_day_section()
+    weekly_load_section()
+    export_section()
+elif st.session_state.subjects and not st.session_state.selected_days:
     st.warning("⚠️ Please select at least one study day in the sidebar!")
-elif selected_days and not st.session_state.subjects:
+elif st.session_state.selected_days and not st.session_state.subjects:
     st.warning("⚠️ Please add at least one subject to generate a plan!")
 
 # ======================